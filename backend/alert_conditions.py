@@ -0,0 +1,66 @@
+# alert_conditions.py
+"""
+Alert condition categories and the rules that raise them.
+
+evaluate_conditions returns (bit, text) pairs: the bit identifies the category
+and is what fingerprints, throttling and history records compare and store;
+the text (with live values) is only shown to users. Every condition gets its
+bit where it is raised, so a new rule cannot silently end up with no category.
+"""
+
+# bit i of a condition mask is CONDITIONS[i]. Masks are stored in history files
+# and users.json, so only ever append to this tuple.
+CONDITIONS = ("Extreme Heat", "Severe Cold", "High Wind", "High UV",
+              "Poor Air", "Thunderstorm", "Heavy Rain", "Snow")
+(EXTREME_HEAT, SEVERE_COLD, HIGH_WIND, HIGH_UV,
+ POOR_AIR, THUNDERSTORM, HEAVY_RAIN, SNOW) = (1 << bit for bit in range(len(CONDITIONS)))
+
+
+def evaluate_conditions(temp, wind, uv, pm25, pm10, code):
+    """Return the (category bit, reason text) pairs for one location's readings."""
+    conditions = []
+
+    # Temperature
+    if temp is not None:
+        if temp >= 40:
+            conditions.append((EXTREME_HEAT, f"Extreme Heat ({temp}°C)"))
+        elif temp <= 5:
+            conditions.append((SEVERE_COLD, f"Severe Cold ({temp}°C)"))
+
+    # Wind
+    if wind is not None and wind >= 60:
+        conditions.append((HIGH_WIND, f"High Wind ({wind} km/h)"))
+
+    # UV
+    if uv is not None and uv >= 7:
+        conditions.append((HIGH_UV, f"High UV (index {uv})"))
+
+    # Air quality - use pm2_5 or pm10 if available
+    # thresholds are approximate and can be adjusted
+    if pm25 is not None and pm25 >= 150:
+        conditions.append((POOR_AIR, f"Poor Air (PM2.5 {pm25})"))
+    elif pm10 is not None and pm10 >= 200:
+        conditions.append((POOR_AIR, f"Poor Air (PM10 {pm10})"))
+
+    # Weather codes (simple mapping)
+    if code in [95, 96, 99]:
+        conditions.append((THUNDERSTORM, "Thunderstorm"))
+    elif code in [61, 63, 65]:
+        conditions.append((HEAVY_RAIN, "Heavy Rain"))
+    elif code in [71, 73, 75]:
+        conditions.append((SNOW, "Snow / Heavy Snow"))
+
+    return conditions
+
+
+def conditions_mask(conditions):
+    """Bitmask of the categories in (bit, text) pairs."""
+    mask = 0
+    for bit, _ in conditions or []:
+        mask |= bit
+    return mask
+
+
+def mask_conditions(mask):
+    """Category names set in mask."""
+    return [name for bit, name in enumerate(CONDITIONS) if mask & (1 << bit)]
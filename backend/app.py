@@ -1,14 +1,26 @@
 # app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import json, os
+import hmac
 from datetime import datetime, timedelta
-import requests
 from apscheduler.schedulers.background import BackgroundScheduler
 
 # Import bot logic if you use it for chat
 import bot
 
+# shared, cached Open-Meteo client (also used by bot for chat)
+import live_data
+
+# append-only alert/reading history (kept out of users.json)
+import history_store
+
+# alert rules and their condition categories
+from alert_conditions import evaluate_conditions, conditions_mask
+
+# streaming NDJSON bulk user import/export/patch (also a CLI)
+import user_bulk
+
 # telegram helper
 from telegram_bot import send_message
 
@@ -21,6 +33,10 @@ DATABASE_DIR = os.path.join(BASE_DIR, "../database")
 os.makedirs(DATABASE_DIR, exist_ok=True)
 USERS_FILE = os.path.join(DATABASE_DIR, "users.json")
 
+# shared secret for /admin/* endpoints (sent as X-Admin-Token header);
+# the admin API is disabled while it is unset
+ADMIN_TOKEN = os.environ.get("AERIS_ADMIN_TOKEN")
+
 # ensure file exists
 if not os.path.exists(USERS_FILE):
     with open(USERS_FILE, "w") as f:
@@ -30,9 +46,10 @@ def load_users():
     with open(USERS_FILE, "r") as f:
         return json.load(f)
 
+# Handlers that load, modify and save users must hold user_bulk.users_lock() across
+# all three steps, or a concurrent bulk commit / scheduler / CLI write is lost.
 def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=2)
+    user_bulk.save_users(users, USERS_FILE)
     print(f"[DEBUG] Users saved to: {USERS_FILE}")
 
 # -------------------- REGISTER --------------------
@@ -46,30 +63,15 @@ def register():
     if not username or not email or not password:
         return jsonify({"success": False, "msg": "Missing fields"}), 400
 
-    users = load_users()
-    if any(u["username"] == username for u in users):
-        return jsonify({"success": False, "msg": "Username already exists"}), 400
-
-    new_user = {
-        "username": username,
-        "email": email,
-        "password": password,
-        "mode": "Low",
-        "age": None,
-        "conditions": "",
-        "joined": datetime.now().strftime("%Y-%m-%d"),
-        "notifications": {},
-        "telegram_chat_id": None,
-        "latitude": None,
-        "longitude": None,
-        # fields for alerts status
-        "last_alert_time": None,
-        "last_alert_reason": None,
-        "active_conditions": []
-    }
-
-    users.append(new_user)
-    save_users(users)
+    with user_bulk.users_lock(USERS_FILE):
+        users = load_users()
+        if any(u["username"] == username for u in users):
+            return jsonify({"success": False, "msg": "Username already exists"}), 400
+
+        new_user = user_bulk.default_user(username, email, password)
+
+        users.append(new_user)
+        save_users(users)
 
     return jsonify({"success": True, "msg": "Registered successfully", "user": new_user})
 
@@ -110,19 +112,20 @@ def update_user():
     if not username:
         return jsonify({"success": False, "msg": "Username is required"}), 400
 
-    users = load_users()
-    user = next((u for u in users if u["username"] == username), None)
-    if not user:
-        return jsonify({"success": False, "msg": "User not found"}), 404
+    with user_bulk.users_lock(USERS_FILE):
+        users = load_users()
+        user = next((u for u in users if u["username"] == username), None)
+        if not user:
+            return jsonify({"success": False, "msg": "User not found"}), 404
 
-    # update allowed fields (everything except username/password)
-    updated_fields = []
-    for key, value in data.items():
-        if key not in ["username", "password"]:
-            user[key] = value
-            updated_fields.append(key)
+        # update allowed fields (everything except username/password)
+        updated_fields = []
+        for key, value in data.items():
+            if key not in ["username", "password"]:
+                user[key] = value
+                updated_fields.append(key)
 
-    save_users(users)
+        save_users(users)
     return jsonify({"success": True, "msg": "User updated", "user": user, "updated_fields": updated_fields})
 
 # -------------------- CHAT --------------------
@@ -133,13 +136,73 @@ def chat():
     if not query:
         return jsonify({"success": False, "response": "Empty query"}), 400
 
+    deadline = bot.Deadline(bot.CHAT_BUDGET)
     try:
-        response = bot.generate_response(query)
-        return jsonify({"success": True, "response": response})
+        response = bot.generate_response(query, deadline=deadline)
+        # stages skipped/downgraded to stay within the latency budget (empty when none)
+        return jsonify({"success": True, "response": response, "degraded": deadline.degradations})
     except Exception as e:
         print(f"[ERROR] Chat failed: {e}")
         return jsonify({"success": False, "response": "Something went wrong"}), 500
 
+# -------------------- ADMIN: KNOWLEDGE RELOAD --------------------
+def admin_unauthorized():
+    if not ADMIN_TOKEN:
+        return jsonify({"success": False, "msg": "Admin API disabled (set AERIS_ADMIN_TOKEN)"}), 403
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return jsonify({"success": False, "msg": "Unauthorized"}), 401
+    return None
+
+@app.route("/admin/reload_kb", methods=["POST"])
+def admin_reload_kb():
+    denied = admin_unauthorized()
+    if denied:
+        return denied
+
+    ok, msg = bot.reload_knowledge(force=True)
+    snapshot = bot.get_knowledge_snapshot()
+    return jsonify({
+        "success": ok,
+        "msg": msg,
+        "version": snapshot["version"],
+        "entries": len(snapshot["kb"])
+    }), (200 if ok else 422)
+
+# -------------------- ADMIN: BULK USERS (NDJSON) --------------------
+@app.route("/admin/users/import", methods=["POST"])
+def admin_users_import():
+    denied = admin_unauthorized()
+    if denied:
+        return denied
+
+    on_conflict = request.args.get("on_conflict", "skip")
+    batch_size = request.args.get("batch_size", default=user_bulk.DEFAULT_BATCH_SIZE, type=int)
+    try:
+        summary = user_bulk.import_users(request.stream, USERS_FILE, batch_size, on_conflict)
+    except ValueError as e:
+        return jsonify({"success": False, "msg": str(e)}), 400
+    return jsonify({"success": summary["failed"] == 0, **summary})
+
+@app.route("/admin/users/patch", methods=["POST"])
+def admin_users_patch():
+    denied = admin_unauthorized()
+    if denied:
+        return denied
+
+    batch_size = request.args.get("batch_size", default=user_bulk.DEFAULT_BATCH_SIZE, type=int)
+    summary = user_bulk.patch_users(request.stream, USERS_FILE, batch_size)
+    return jsonify({"success": summary["failed"] == 0, **summary})
+
+@app.route("/admin/users/export", methods=["GET"])
+def admin_users_export():
+    denied = admin_unauthorized()
+    if denied:
+        return denied
+
+    include_passwords = request.args.get("include_passwords") in ("1", "true")
+    return Response(user_bulk.export_users(USERS_FILE, include_passwords=include_passwords),
+                    mimetype="application/x-ndjson")
+
 # -------------------- TELEGRAM TEST --------------------
 @app.route("/test_telegram_alert", methods=["POST"])
 def test_telegram_alert():
@@ -152,12 +215,15 @@ def test_telegram_alert():
         return jsonify({"success": False, "msg": "User not linked"}), 400
 
     try:
-        send_message(user["telegram_chat_id"], "✅ This is a test alert from Aeris AI!")
+        if not send_message(user["telegram_chat_id"], "✅ This is a test alert from Aeris AI!"):
+            return jsonify({"success": False, "msg": "Telegram failed"}), 502
         # update last alert info for UI feedback
-        user["last_alert_time"] = datetime.now().isoformat()
-        user["last_alert_reason"] = "Test Alert"
-        user["active_conditions"] = ["Test"]
-        save_users(users)
+        user_bulk.update_users({username: {
+            "last_alert_time": datetime.now().isoformat(),
+            "last_alert_reason": "Test Alert",
+            "active_conditions": ["Test"],
+            "active_conditions_mask": 0
+        }}, USERS_FILE)
         return jsonify({"success": True})
     except Exception as e:
         print(f"[Telegram Error] {e}")
@@ -206,19 +272,55 @@ def alerts_status(username):
         "next_check": next_check
     })
 
+# -------------------- HISTORY --------------------
+@app.route("/history/alerts/<username>", methods=["GET"])
+def history_alerts(username):
+    hours = request.args.get("hours", default=24 * 7, type=float)
+    return jsonify({"success": True, "alerts": history_store.recent_alerts(username, hours=hours)})
+
+@app.route("/history/readings", methods=["GET"])
+def history_readings():
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    if lat is None or lon is None:
+        return jsonify({"success": False, "msg": "lat and lon are required"}), 400
+    hours = request.args.get("hours", default=24, type=float)
+    return jsonify({"success": True, "readings": history_store.recent_readings(lat, lon, hours=hours)})
+
 # -------------------- BACKGROUND JOB (alerts aggregator) --------------------
+ALERT_THROTTLE = timedelta(minutes=240)
+
+# per location cell: compact fingerprint of the last evaluated condition set,
+# the users it was applied to, and until when their throttle window holds.
+# In memory only; after a restart every cell is simply evaluated again.
+cell_alert_state = {}
+
+def cell_unchanged(cell, fingerprint, usernames, now):
+    """True if the cell's conditions and users are unchanged and still inside the throttle window."""
+    state = cell_alert_state.get(cell)
+    if not state or state["fingerprint"] != fingerprint:
+        return False
+    if not usernames <= state["users"]:
+        return False  # someone new moved into / registered in this cell
+    return state["until"] is None or now < state["until"]
+
 def check_alerts():
     """
-    Runs on schedule. For each user with a telegram_chat_id and location:
-    - fetch current weather + hourly if available
-    - evaluate multiple alert conditions
-    - send one aggregated message (if any condition triggers)
-    - update user's last_alert_time/reason/active_conditions in users.json
+    Runs on schedule. Users with a telegram_chat_id and location are grouped by
+    location cell; for each cell:
+    - fetch current weather + hourly if available (once per cell)
+    - evaluate multiple alert conditions (once per cell)
+    - skip the whole cell if its condition fingerprint is unchanged and the
+      throttle window still applies to all its users
+    - otherwise send one aggregated message to each user not recently alerted
+      and update their last_alert_time/reason/active_conditions(_mask) in users.json
     """
     print("[Scheduler] Checking for alerts...")
+    stats_before = dict(live_data.stats)
     users = load_users()
     now = datetime.now()
 
+    cells = {}
     for user in users:
         try:
             chat_id = user.get("telegram_chat_id")
@@ -227,19 +329,28 @@ def check_alerts():
 
             if not chat_id or lat is None or lon is None:
                 continue  # need both
+            cells.setdefault(live_data.cell_key(lat, lon), []).append(user)
+        except Exception as e:
+            print(f"[Scheduler Error] bad user record {user.get('username')}: {e}")
+
+    skipped_cells = 0
+    for cell, cell_users in cells.items():
+        try:
+            lat, lon = cell
 
-            # fetch data: current weather + some hourly parameters
-            url = (f"https://api.open-meteo.com/v1/forecast?latitude={lat}"
-                   f"&longitude={lon}&current_weather=true&hourly=uv_index,pm2_5,pm10&forecast_days=1")
-            res = requests.get(url, timeout=15).json()
+            # fetch data: current weather + this hour's UV / particulates.
+            # One (cached, shared with chat) request per ~1 km cell.
+            weather = live_data.get_forecast(lat, lon, current_weather=True, timeout=15) or {}
+            air = live_data.get_air_quality(lat, lon, hourly=("uv_index", "pm2_5", "pm10"),
+                                            forecast_hours=1, timeout=15) or {}
 
             # safe extraction
-            current = res.get("current_weather", {})
+            current = weather.get("current_weather", {})
             temp = current.get("temperature")
             wind = current.get("windspeed")
             code = current.get("weathercode")
 
-            hourly = res.get("hourly", {})
+            hourly = air.get("hourly", {})
             uv_list = hourly.get("uv_index", [])
             pm25_list = hourly.get("pm2_5", [])
             pm10_list = hourly.get("pm10", [])
@@ -248,88 +359,107 @@ def check_alerts():
             pm25 = pm25_list[0] if pm25_list else None
             pm10 = pm10_list[0] if pm10_list else None
 
-            # evaluate conditions and collect reasons
-            reasons = []
-
-            # Temperature
-            if temp is not None:
-                if temp >= 40:
-                    reasons.append(f"Extreme Heat ({temp}°C)")
-                elif temp <= 5:
-                    reasons.append(f"Severe Cold ({temp}°C)")
-
-            # Wind
-            if wind is not None and wind >= 60:
-                reasons.append(f"High Wind ({wind} km/h)")
-
-            # UV
-            if uv is not None and uv >= 7:
-                reasons.append(f"High UV (index {uv})")
-
-            # Air quality - use pm2_5 or pm10 if available
-            # thresholds are approximate and can be adjusted
-            if pm25 is not None and pm25 >= 150:
-                reasons.append(f"Poor Air (PM2.5 {pm25})")
-            elif pm10 is not None and pm10 >= 200:
-                reasons.append(f"Poor Air (PM10 {pm10})")
-
-            # Weather codes (simple mapping)
-            if code in [95, 96, 99]:
-                reasons.append("Thunderstorm")
-            elif code in [61, 63, 65]:
-                reasons.append("Heavy Rain")
-            elif code in [71, 73, 75]:
-                reasons.append("Snow / Heavy Snow")
-
-            # If any reasons, send aggregated message
-            if reasons:
+            # evaluate conditions: (category bit, reason text) pairs
+            conditions = evaluate_conditions(temp, wind, uv, pm25, pm10, code)
+            reasons = [text for _, text in conditions]
+            # categories only: live values (e.g. 41.2°C vs 41.5°C) don't count as a change
+            fingerprint = conditions_mask(conditions)
+
+            try:
+                history_store.append_reading(lat, lon, temp=temp, wind=wind, uv=uv, pm25=pm25,
+                                             pm10=pm10, code=code, mask=fingerprint)
+            except Exception as e:
+                print(f"[History Error] Failed recording reading for {cell}: {e}")
+
+            usernames = frozenset(u.get("username") for u in cell_users)
+            if cell_unchanged(cell, fingerprint, usernames, now):
+                skipped_cells += 1
+                continue
+
+            if not reasons:
+                # nothing to send; remember the calm state so the cell is skipped until it changes
+                cell_alert_state[cell] = {"fingerprint": fingerprint, "users": usernames, "until": None}
+                continue
+
+            # build message (same for everyone in the cell)
+            header = "🚨 Weather Alert from Aeris AI"
+            body = "\n".join(f"- {r}" for r in reasons)
+            footer = "\nStay safe. Check the dashboard for details."
+            message = f"{header}\n\n{body}{footer}"
+
+            handled = set()
+            until = now + ALERT_THROTTLE
+            updates = {}  # username -> alert fields, merged into a fresh users.json below
+            for user in cell_users:
                 # Throttle: avoid repeating identical alerts within last 4 hours
                 last_alert_iso = user.get("last_alert_time")
                 skip_send = False
                 if last_alert_iso:
                     try:
                         last_dt = datetime.fromisoformat(last_alert_iso)
-                        if now - last_dt < timedelta(minutes=240):
-                            # if last_alert_reason exists and new reasons are subset of last, skip
-                            last_reasons = set(user.get("active_conditions", []))
-                            new_reasons = set(reasons)
+                        if now - last_dt < ALERT_THROTTLE:
+                            # if the new condition categories are a subset of the last alert's, skip
+                            # (compared by category, like the cell fingerprint, not by live values)
+                            # (records from before masks were stored have none -> not skipped)
+                            last_mask = user.get("active_conditions_mask") or 0
                             # if identical or subset, skip to avoid spam
-                            if new_reasons.issubset(last_reasons):
+                            if fingerprint & ~last_mask == 0:
                                 skip_send = True
+                                until = min(until, last_dt + ALERT_THROTTLE)
                     except Exception:
                         # parsing issue -> don't skip
                         skip_send = False
 
                 if skip_send:
                     print(f"[Scheduler] Skipping alert for {user.get('username')} (recently alerted).")
-                else:
-                    # build message
-                    header = "🚨 Weather Alert from Aeris AI"
-                    body = "\n".join(f"- {r}" for r in reasons)
-                    footer = "\nStay safe. Check the dashboard for details."
-                    message = f"{header}\n\n{body}{footer}"
-
-                    try:
-                        send_message(chat_id, message)
-                        # update user record
-                        user["last_alert_time"] = now.isoformat()
-                        user["last_alert_reason"] = ", ".join(reasons)
-                        user["active_conditions"] = reasons
-                        save_users(users)
-                        print(f"[ALERT] Sent to {user.get('username')}: {reasons}")
-                    except Exception as e:
-                        print(f"[Scheduler Error] Failed sending to {user.get('username')}: {e}")
+                    handled.add(user.get("username"))
+                    continue
+
+                if not send_message(user["telegram_chat_id"], message):
+                    # not recorded as alerted or handled, so the cell is retried next sweep
+                    print(f"[Scheduler Error] Failed sending to {user.get('username')}.")
+                    continue
+
+                # update user record
+                updates[user.get("username")] = {
+                    "last_alert_time": now.isoformat(),
+                    "last_alert_reason": ", ".join(reasons),
+                    "active_conditions": reasons,
+                    "active_conditions_mask": fingerprint
+                }
+                handled.add(user.get("username"))
+                try:
+                    history_store.append_alert(user.get("username"), lat, lon, fingerprint)
+                except Exception as e:
+                    print(f"[History Error] Failed recording alert for {user.get('username')}: {e}")
+                print(f"[ALERT] Sent to {user.get('username')}: {reasons}")
+
+            if updates:
+                # the sweep's copy of users is stale by now; merge into the current file
+                user_bulk.update_users(updates, USERS_FILE)
+            # users whose send failed are not in `handled`, so the cell is retried next sweep
+            cell_alert_state[cell] = {"fingerprint": fingerprint, "users": frozenset(handled), "until": until}
 
         except Exception as e:
-            print(f"[Scheduler Error] unexpected: {e}")
+            print(f"[Scheduler Error] unexpected for cell {cell}: {e}")
+
+    fetched = live_data.stats["misses"] - stats_before["misses"]
+    cached = live_data.stats["hits"] - stats_before["hits"]
+    print(f"[Scheduler] {len(cells)} cells, {skipped_cells} unchanged and skipped. "
+          f"Live data: {fetched} upstream requests, {cached} served from cache.")
 
 # -------------------- MAIN --------------------
 if __name__ == "__main__":
     print(f"[INFO] Users file: {USERS_FILE}")
 
+    # pick up knowledge.json edits without restarting (and reloading the model)
+    bot.start_kb_watcher()
+
     scheduler = BackgroundScheduler()
     # every 4 hours (240 minutes). change minutes=180 for 3 hours or smaller for testing
     scheduler.add_job(check_alerts, "interval", minutes=240)
+    # daily: drop expired history, downsample old readings
+    scheduler.add_job(history_store.compact, "interval", hours=24)
     scheduler.start()
 
     app.run(debug=True, host="0.0.0.0", port=5000)
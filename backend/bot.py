@@ -7,22 +7,43 @@ import os
 import requests
 from datetime import datetime
 import traceback
+import threading
+import sys
 
 # HuggingFace / torch
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 import torch
 
+from inference_pool import InferencePool
+from deadline import Deadline
+import live_data
+
 # -------------------- SAFETY / PERFORMANCE TUNING --------------------
 # limit CPU threads to avoid saturating laptop
 os.environ.setdefault("OMP_NUM_THREADS", "1")
 os.environ.setdefault("MKL_NUM_THREADS", "1")
 torch.set_num_threads(1)
 
+# optional pool of forked inference workers sharing the loaded weights.
+# 0 keeps generation in this process (single core, original behaviour).
+INFERENCE_WORKERS = int(os.environ.get("AERIS_INFERENCE_WORKERS", "0"))
+THREADS_PER_WORKER = int(os.environ.get("AERIS_THREADS_PER_WORKER", "1"))
+INFERENCE_TIMEOUT = float(os.environ.get("AERIS_INFERENCE_TIMEOUT", "60"))  # seconds per generation
+
 # HTTP session for connection reuse and global timeout usage
 SESSION = requests.Session()
 DEFAULT_TIMEOUT = 6  # seconds for requests (small enough to avoid hangs)
 SESSION.headers.update({"User-Agent": "AerisAI/1.0 (contact: none)"})
 
+# -------------------- LATENCY BUDGET --------------------
+# overall time limit for one generate_response call, split across stages below
+CHAT_BUDGET = float(os.environ.get("AERIS_CHAT_BUDGET", "20"))  # seconds
+MIN_HTTP_BUDGET = 1.0    # don't start an HTTP call with less than this left
+MIN_WIKI_BUDGET = 3.0    # Wikipedia needs a search + summary round trip
+MIN_MODEL_BUDGET = 1.5   # skip generation entirely below this
+BEAM_SEARCH_BUDGET = 8.0 # below this, generate greedily instead of beam search
+EVAL_BUDGET = 6.0        # below this, skip model self-evaluation (use heuristic)
+
 # -------------------- FILE PATHS --------------------
 BASE_DIR = os.path.dirname(__file__)
 KB_FILE = os.path.join(BASE_DIR, "../database/knowledge.json")
@@ -33,22 +54,16 @@ db_dir = os.path.dirname(KB_FILE)
 os.makedirs(db_dir, exist_ok=True)
 
 # -------------------- LOAD KNOWLEDGE (SAFE) --------------------
-knowledge_base = {}
-if os.path.exists(KB_FILE):
-    try:
-        with open(KB_FILE, "r", encoding="utf-8") as f:
-            knowledge_base = json.load(f)
-            if not isinstance(knowledge_base, dict):
-                print("[WARN] knowledge.json not a dict; ignoring and using empty KB.")
-                knowledge_base = {}
-    except Exception as e:
-        print(f"[WARN] Failed to load KB ({KB_FILE}): {e}")
-        knowledge_base = {}
-else:
-    # create empty KB file to avoid file not found later
+# create empty KB file to avoid file not found later; the KB itself is loaded
+# (and hot-reloaded) through reload_knowledge() once the helpers are defined
+if not os.path.exists(KB_FILE):
     with open(KB_FILE, "w", encoding="utf-8") as f:
         json.dump({}, f, indent=2)
-    knowledge_base = {}
+
+# seconds between knowledge.json change checks done by the watcher thread
+KB_WATCH_INTERVAL = float(os.environ.get("AERIS_KB_WATCH_INTERVAL", "5"))
+# max number of memoised query -> entry lookups kept per KB snapshot
+KB_MATCH_CACHE_SIZE = 1024
 
 PREBUILT_RESPONSES = {
     "hello": ["Hey there!", "Hi! How’s it going?", "Hello!"],
@@ -100,51 +115,195 @@ def normalize_query(query):
         return ""
     return re.sub(r"[^\w\s]", "", query.lower().strip())
 
-def fetch_knowledge(query):
+# -------------------- KNOWLEDGE HOT RELOAD --------------------
+def validate_knowledge(data):
+    """
+    Raise ValueError if data is not a usable knowledge base
+    (dict of entries, each a dict with a string definition).
+    """
+    if not isinstance(data, dict):
+        raise ValueError("knowledge.json must contain a JSON object")
+    for key, entry in data.items():
+        if not isinstance(entry, dict):
+            raise ValueError(f"entry {key!r} is not an object")
+        if not isinstance(entry.get("definition", ""), str):
+            raise ValueError(f"entry {key!r} has a non-string definition")
+        if not isinstance(entry.get("term", key), str):
+            raise ValueError(f"entry {key!r} has a non-string term")
+        aliases = entry.get("aliases", [])
+        if not isinstance(aliases, list) or not all(isinstance(a, str) for a in aliases):
+            raise ValueError(f"entry {key!r} has invalid aliases (expected list of strings)")
+
+def build_knowledge_snapshot(kb, stamp=None, version=0):
+    """
+    Build the lookup structures for a validated KB. Snapshots are never
+    mutated after being published except for their own match cache, so
+    readers holding one always see a consistent view.
+    """
+    entries = {}
+    for key, entry in kb.items():
+        entries[normalize_query(entry.get("term", key))] = entry
+        for alias in entry.get("aliases", []):
+            entries[normalize_query(alias)] = entry
+    return {
+        "kb": kb,
+        "entries": entries,
+        "terms": list(entries.keys()),
+        "match_cache": {},
+        "stamp": stamp,
+        "version": version,
+    }
+
+_kb_lock = threading.Lock()
+_kb_snapshot = build_knowledge_snapshot({})
+knowledge_base = {}
+_kb_watcher = None
+
+def _kb_file_stamp():
+    try:
+        st = os.stat(KB_FILE)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def get_knowledge_snapshot():
+    """Return the current KB snapshot; callers should grab it once per request."""
+    return _kb_snapshot
+
+def reload_knowledge(force=False):
+    """
+    Load knowledge.json, build new lookup structures and swap them in atomically.
+    On any read/validation error the currently live KB is kept.
+    Returns (ok, message).
+    """
+    global _kb_snapshot, knowledge_base
+    with _kb_lock:
+        stamp = _kb_file_stamp()
+        if not force and stamp is not None and stamp == _kb_snapshot["stamp"]:
+            return True, "Knowledge base unchanged."
+        try:
+            with open(KB_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            validate_knowledge(data)
+            snapshot = build_knowledge_snapshot(data, stamp=stamp, version=_kb_snapshot["version"] + 1)
+        except Exception as e:
+            print(f"[WARN] Failed to load KB ({KB_FILE}): {e}. Keeping previous KB (v{_kb_snapshot['version']}).")
+            return False, f"Reload failed, previous knowledge base kept: {e}"
+        _kb_snapshot = snapshot
+        knowledge_base = data
+    print(f"[INFO] Knowledge base v{snapshot['version']} loaded: {len(data)} entries, {len(snapshot['entries'])} terms.")
+    return True, f"Loaded {len(data)} entries."
+
+def _kb_watch_loop(stop_event):
+    while not stop_event.wait(KB_WATCH_INTERVAL):
+        try:
+            stamp = _kb_file_stamp()
+            if stamp is not None and stamp != _kb_snapshot["stamp"]:
+                reload_knowledge()
+        except Exception as e:
+            print(f"[WARN] KB watcher error: {e}")
+
+def start_kb_watcher():
+    """Start (once) a daemon thread that reloads knowledge.json when it changes."""
+    global _kb_watcher
+    if _kb_watcher is not None:
+        return _kb_watcher
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_kb_watch_loop, args=(stop_event,), name="kb-watcher", daemon=True)
+    thread.start()
+    _kb_watcher = stop_event
+    print(f"[INFO] Watching {KB_FILE} for changes every {KB_WATCH_INTERVAL}s.")
+    return _kb_watcher
+
+reload_knowledge(force=True)
+
+def fetch_knowledge(query, snapshot=None):
     """
     Try close match in knowledge_base. More robust: check substring fallback
     """
     q = normalize_query(query)
     if not q:
         return None
-    entries = {}
-    for key, entry in (knowledge_base or {}).items():
-        term = normalize_query(entry.get("term", key))
-        entries[term] = entry
-        for alias in entry.get("aliases", []) if isinstance(entry.get("aliases", []), list) else []:
-            entries[normalize_query(alias)] = entry
+    snapshot = snapshot or get_knowledge_snapshot()
+    cache = snapshot["match_cache"]
+    if q in cache:
+        return cache[q]
 
+    entries = snapshot["entries"]
+    result = None
     # exact/close-match
-    matches = difflib.get_close_matches(q, entries.keys(), n=1, cutoff=0.6)
+    matches = difflib.get_close_matches(q, snapshot["terms"], n=1, cutoff=0.6)
     if matches:
-        return entries[matches[0]]
-    # substring fallback (useful for short queries)
-    for k in entries.keys():
-        if q in k:
-            return entries[k]
-    return None
+        result = entries[matches[0]]
+    else:
+        # substring fallback (useful for short queries)
+        for k in snapshot["terms"]:
+            if q in k:
+                result = entries[k]
+                break
 
-def fetch_wikipedia_summary(query, sentences=3):
+    if len(cache) < KB_MATCH_CACHE_SIZE:
+        cache[q] = result
+    return result
+
+# The wikipedia library calls requests.get() without a timeout. Route its HTTP
+# through SESSION instead, with a timeout taken from the calling thread's deadline.
+_wiki_context = threading.local()
+
+class _WikiHTTP:
+    """Stand-in for the `requests` module inside the wikipedia library."""
+    def get(self, url, params=None, headers=None, **kwargs):
+        deadline = getattr(_wiki_context, "deadline", None)
+        timeout = DEFAULT_TIMEOUT
+        if deadline is not None:
+            if not deadline.has(MIN_HTTP_BUDGET):
+                raise requests.Timeout("no time left for wikipedia request")
+            timeout = deadline.timeout(DEFAULT_TIMEOUT)
+        kwargs.setdefault("timeout", timeout)
+        return SESSION.get(url, params=params, headers=headers, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+sys.modules["wikipedia.wikipedia"].requests = _WikiHTTP()
+
+def _wiki_call(deadline, fn, *args, **kwargs):
+    """Run a wikipedia library call with its HTTP requests bounded by the deadline."""
+    _wiki_context.deadline = deadline
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _wiki_context.deadline = None
+
+def fetch_wikipedia_summary(query, sentences=3, deadline=None):
     """
     Search and return short summary. Robust to disambiguation / page errors.
     """
+    def out_of_time():
+        return deadline is not None and not deadline.has(MIN_HTTP_BUDGET)
+
     try:
-        results = wikipedia.search(query, results=5)
+        results = _wiki_call(deadline, wikipedia.search, query, results=5)
         if not results:
             return None
         # try each result until a non-empty summary is returned
         for title in results:
+            if out_of_time():
+                deadline.degrade("wikipedia", "stopped trying search results")
+                return None
             try:
                 # limit sentences to keep response short
-                s = wikipedia.summary(title, sentences=sentences, auto_suggest=False, redirect=True)
+                s = _wiki_call(deadline, wikipedia.summary, title, sentences=sentences, auto_suggest=False, redirect=True)
                 if s and len(s.strip()) > 20:
                     return s
             except wikipedia.DisambiguationError as e:
                 # pick first non-empty option from options if possible (very cautious)
                 options = e.options[:3]
                 for opt in options:
+                    if out_of_time():
+                        break
                     try:
-                        s = wikipedia.summary(opt, sentences=sentences, auto_suggest=False, redirect=True)
+                        s = _wiki_call(deadline, wikipedia.summary, opt, sentences=sentences, auto_suggest=False, redirect=True)
                         if s and len(s.strip()) > 20:
                             return s
                     except Exception:
@@ -155,11 +314,17 @@ def fetch_wikipedia_summary(query, sentences=3):
         pass
     return None
 
-def safe_request_get(url, params=None, timeout=DEFAULT_TIMEOUT):
+def safe_request_get(url, params=None, timeout=DEFAULT_TIMEOUT, deadline=None):
     """
     Wrapper for requesting with session, timeout, and safe JSON handling.
+    The timeout is shortened to what is left of the deadline, if one is given.
     Returns (json_obj or None, text or None)
     """
+    if deadline is not None:
+        if not deadline.has(MIN_HTTP_BUDGET):
+            deadline.degrade("http", f"skipped request to {url}")
+            return None, None
+        timeout = deadline.timeout(timeout)
     try:
         resp = SESSION.get(url, params=params, timeout=timeout)
         resp.raise_for_status()
@@ -180,26 +345,24 @@ def get_user_location(username):
             return user.get("latitude"), user.get("longitude")
     return None, None
 
-def geocode_city(city_name):
+def geocode_city(city_name, deadline=None):
     if not city_name:
         return None, None
     try:
         params = {"q": city_name, "format": "json", "limit": 1}
         url = "https://nominatim.openstreetmap.org/search"
-        json_resp, _ = safe_request_get(url, params=params)
+        json_resp, _ = safe_request_get(url, params=params, deadline=deadline)
         if json_resp and isinstance(json_resp, list) and len(json_resp) > 0:
             return float(json_resp[0]["lat"]), float(json_resp[0]["lon"])
     except Exception:
         pass
     return None, None
 
-def fetch_weather(lat, lon):
+def fetch_weather(lat, lon, deadline=None):
     if lat is None or lon is None:
         return "Weather info unavailable (no location)."
     try:
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {"latitude": lat, "longitude": lon, "current_weather": True}
-        json_resp, _ = safe_request_get(url, params=params)
+        json_resp = live_data.get_forecast(lat, lon, current_weather=True, deadline=deadline)
         if not json_resp:
             return "Weather info unavailable."
         cw = json_resp.get("current_weather", {}) or {}
@@ -212,13 +375,12 @@ def fetch_weather(lat, lon):
     except Exception:
         return "Weather info unavailable."
 
-def fetch_aqi_uv(lat, lon):
+def fetch_aqi_uv(lat, lon, deadline=None):
     if lat is None or lon is None:
         return "AQI/UV info unavailable (no location)."
     try:
-        url = "https://air-quality-api.open-meteo.com/v1/air-quality"
-        params = {"latitude": lat, "longitude": lon, "hourly": "pm2_5,pm10,european_aqi", "current_weather": False}
-        json_resp, _ = safe_request_get(url, params=params)
+        json_resp = live_data.get_air_quality(lat, lon, hourly=("european_aqi",), current=("uv_index",),
+                                              forecast_hours=1, deadline=deadline)
         if not json_resp:
             return "AQI/UV info unavailable."
         hourly = json_resp.get("hourly", {}) or {}
@@ -235,26 +397,42 @@ def fetch_aqi_uv(lat, lon):
         return "AQI/UV info unavailable."
 
 # -------------------- MODEL / LLM WRAPPER (SAFE) --------------------
-def ask_flan_t5(prompt):
+GENERATION_DEFAULTS = {"max_new_tokens": 128, "num_beams": 4, "early_stopping": True, "do_sample": False}
+
+def _generate_text(prompt, **gen_kwargs):
+    """Run one generation on the loaded model (in this process or a pool worker)."""
+    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+    with torch.no_grad():
+        outputs = model.generate(**inputs, **{**GENERATION_DEFAULTS, **gen_kwargs})
+    return tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+def ask_flan_t5(prompt, deadline=None, **gen_kwargs):
     """
     Generate with T5. If model not available, return None so caller can fallback.
+    With a deadline, generation is skipped when almost out of time, switched to
+    greedy decoding when time is short, and capped with max_time otherwise.
     """
     if not MODEL_LOADED or model is None or tokenizer is None:
         return None
 
+    timeout = INFERENCE_TIMEOUT
+    if deadline is not None:
+        if not deadline.has(MIN_MODEL_BUDGET):
+            deadline.degrade("model", "skipped generation")
+            return None
+        if not deadline.has(BEAM_SEARCH_BUDGET) and gen_kwargs.get("num_beams", GENERATION_DEFAULTS["num_beams"]) > 1:
+            deadline.degrade("model", "greedy decoding instead of beam search")
+            gen_kwargs["num_beams"] = 1
+            gen_kwargs["early_stopping"] = False
+        gen_kwargs.setdefault("max_time", deadline.remaining())
+        timeout = deadline.timeout(INFERENCE_TIMEOUT)
+
     try:
-        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)
-        inputs = {k: v.to(device) for k, v in inputs.items()}
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=128,
-                num_beams=4,
-                early_stopping=True,
-                do_sample=False
-            )
-        text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        return text
+        # fall back to in-process generation if every pool worker is down
+        if inference_pool is not None and inference_pool.alive_workers():
+            return inference_pool.generate(prompt, timeout=timeout, **gen_kwargs)
+        return _generate_text(prompt, **gen_kwargs)
     except RuntimeError as e:
         try:
             if torch.cuda.is_available():
@@ -264,23 +442,43 @@ def ask_flan_t5(prompt):
         print(f"[WARN] Model generation failed: {e}")
         return None
     except Exception as e:
-        print(f"[WARN] Model generation error: {e}")
+        print(f"[WARN] Model generation error: {e!r}")
         return None
 
-def evaluate_answer(question, answer):
+# Fork the workers now: the model is loaded but no inference (and no server or
+# watcher threads) has run yet, so the children inherit clean, shared weights.
+inference_pool = None
+if MODEL_LOADED and INFERENCE_WORKERS > 0:
+    if device is not None and device.type != "cpu":
+        print("[WARN] Inference pool is CPU-only; keeping generation in-process on", device)
+    else:
+        try:
+            inference_pool = InferencePool(_generate_text, workers=INFERENCE_WORKERS,
+                                           threads_per_worker=THREADS_PER_WORKER).start()
+        except Exception as e:
+            print(f"[WARN] Failed to start inference pool, generating in-process: {e}")
+            inference_pool = None
+
+def evaluate_answer(question, answer, deadline=None):
     """
-    Returns True if answer seems good. If model unavailable, use a simple heuristic.
+    Returns True if answer seems good. If model unavailable (or there is no
+    time left for another generation), use a simple heuristic.
     """
     if not answer:
         return False
 
-    if MODEL_LOADED:
+    use_model = MODEL_LOADED
+    if use_model and deadline is not None and not deadline.has(EVAL_BUDGET):
+        deadline.degrade("evaluate_answer", "skipped model evaluation, used word-overlap heuristic")
+        use_model = False
+
+    if use_model:
         prompt = (
             f"Question: {question}\n"
             f"Answer: {answer}\n"
             f"Evaluate: Is this answer complete, factual, and relevant to the question? Respond only with 'Yes' or 'No'."
         )
-        resp = ask_flan_t5(prompt)
+        resp = ask_flan_t5(prompt, deadline=deadline)
         if resp:
             return "yes" in resp.strip().lower()
 
@@ -323,61 +521,85 @@ def is_live_query(query: str) -> bool:
     return False
 
 # -------------------- KNOWLEDGE-FIRST FLOW --------------------
-def generate_answer_knowledge_first(query, username=None):
+GIVE_UP_ANSWER = "I don't know offhand. Try rephrasing the question or provide more detail — I checked my KB, Wikipedia, and DuckDuckGo."
+
+def generate_answer_knowledge_first(query, username=None, deadline=None):
+    deadline = deadline or Deadline(CHAT_BUDGET)
     q_norm = normalize_query(query)
     # prebuilt greetings
     for key in PREBUILT_RESPONSES:
         if key in q_norm:
             return random.choice(PREBUILT_RESPONSES[key])
 
-    # 1) Knowledge base
-    kb_entry = fetch_knowledge(query)
+    # best unverified answer so far, returned if the deadline hits before a better one
+    best = None
+
+    def out_of_time(stage):
+        if deadline.has(MIN_HTTP_BUDGET):
+            return False
+        deadline.degrade(stage, "skipped, returning best answer so far" if best else "skipped")
+        return True
+
+    # 1) Knowledge base (one snapshot for the whole request, even if a reload lands mid-way)
+    kb_entry = fetch_knowledge(query, get_knowledge_snapshot())
     if kb_entry:
         kb_answer = kb_entry.get("definition", "")
         if kb_answer:
             prompt = f"Question: {query}\nKnowledge: {kb_answer}\nAnswer concisely:"
-            llm_ans = ask_flan_t5(prompt)
+            llm_ans = ask_flan_t5(prompt, deadline=deadline)
             if llm_ans:
                 return llm_ans
             return kb_answer
 
     # 2) Wikipedia fallback
-    wiki_summary = fetch_wikipedia_summary(query, sentences=3)
+    if deadline.has(MIN_WIKI_BUDGET):
+        wiki_summary = fetch_wikipedia_summary(query, sentences=3, deadline=deadline)
+    else:
+        deadline.degrade("wikipedia", "skipped")
+        wiki_summary = None
     if wiki_summary:
         prompt = f"Question: {query}\nWikipedia: {wiki_summary}\nAnswer concisely:"
-        llm_ans = ask_flan_t5(prompt)
-        if llm_ans and evaluate_answer(query, llm_ans):
+        llm_ans = ask_flan_t5(prompt, deadline=deadline)
+        if llm_ans and evaluate_answer(query, llm_ans, deadline=deadline):
             return llm_ans
         q_words = set(normalize_query(query).split())
         summary_words = set(normalize_query(wiki_summary).split())
         if q_words.intersection(summary_words):
             return wiki_summary
+        best = llm_ans or wiki_summary
 
     # 3) DuckDuckGo Instant Answer fallback
+    if out_of_time("duckduckgo"):
+        return best or GIVE_UP_ANSWER
     try:
         params = {"q": query, "format": "json", "no_html": 1, "skip_disambig": 1}
         url = "https://api.duckduckgo.com/"
-        json_resp, text_resp = safe_request_get(url, params=params)
+        json_resp, text_resp = safe_request_get(url, params=params, deadline=deadline)
         abstract = None
         if json_resp:
             abstract = json_resp.get("AbstractText") or json_resp.get("Definition")
         if abstract:
             prompt = f"Question: {query}\nInfo: {abstract}\nAnswer concisely:"
-            llm_ans = ask_flan_t5(prompt)
-            if llm_ans and evaluate_answer(query, llm_ans):
+            llm_ans = ask_flan_t5(prompt, deadline=deadline)
+            if llm_ans and evaluate_answer(query, llm_ans, deadline=deadline):
                 return llm_ans
             q_words = set(normalize_query(query).split())
             abs_words = set(normalize_query(abstract).split())
             if q_words.intersection(abs_words):
                 return abstract
+            best = best or llm_ans or abstract
     except Exception:
         pass
 
-    # 4) Give up politely
-    return "I don't know offhand. Try rephrasing the question or provide more detail — I checked my KB, Wikipedia, and DuckDuckGo."
+    # 4) Give up politely (unless the budget cut the search short: a stage was
+    #    skipped or downgraded, or there is no time left for another model call)
+    if best and (deadline.degradations or not deadline.has(MIN_MODEL_BUDGET)):
+        deadline.degrade("knowledge-first", "returned best unverified answer")
+        return best
+    return GIVE_UP_ANSWER
 
 # -------------------- LIVE DATA HANDLING --------------------
-def handle_live_data(query, username=None):
+def handle_live_data(query, username=None, deadline=None):
     lat = lon = None
     if username:
         lat, lon = get_user_location(username)
@@ -385,8 +607,10 @@ def handle_live_data(query, username=None):
     city_match = re.search(r"in ([a-z\s]+)", query.lower())
     if city_match:
         city = city_match.group(1).strip()
-        lat2, lon2 = geocode_city(city)
+        lat2, lon2 = geocode_city(city, deadline=deadline)
         if lat2 is None:
+            if deadline is not None and deadline.expired():
+                return "Live data is taking too long right now. Please try again."
             return "I couldn't find that city. Please type the city name more exactly."
         lat, lon = lat2, lon2
 
@@ -394,27 +618,31 @@ def handle_live_data(query, username=None):
         return "Please provide your location first (either set your profile location or include 'in <city>')."
 
     if "aqi" in query.lower():
-        return fetch_aqi_uv(lat, lon)
+        return fetch_aqi_uv(lat, lon, deadline=deadline)
     if "weather" in query.lower() or "temperature" in query.lower():
-        return fetch_weather(lat, lon)
+        return fetch_weather(lat, lon, deadline=deadline)
 
     return "Live-data request not recognized."
 
 # -------------------- PUBLIC ENTRYPOINT (IMPROVED ROUTING) --------------------
-def generate_response(query, username=None):
+def generate_response(query, username=None, deadline=None):
     """
     Routing policy:
      - If query looks like a definition/explain request -> knowledge-first flow
      - Else if query looks like a strict live query (contains 'in <city>' or explicit live/time words) -> live flow
      - Else -> knowledge-first flow
+
+    `deadline` (a Deadline, default CHAT_BUDGET seconds) bounds the whole call;
+    stages that were skipped or downgraded are listed in deadline.degradations.
     """
     if not query or not query.strip():
         return "Please ask a question."
+    deadline = deadline or Deadline(CHAT_BUDGET)
 
     # Prefer explicit definition requests first
     if is_definition_query(query):
         try:
-            return generate_answer_knowledge_first(query, username)
+            return generate_answer_knowledge_first(query, username, deadline=deadline)
         except Exception as e:
             print(f"[ERROR] definition flow failed: {e}")
             return "Sorry, I hit a snag while trying to answer that."
@@ -422,14 +650,14 @@ def generate_response(query, username=None):
     # Strict live-data detection
     if is_live_query(query):
         try:
-            return handle_live_data(query, username)
+            return handle_live_data(query, username, deadline=deadline)
         except Exception as e:
             print(f"[ERROR] live data flow failed: {e}")
             return "Live data currently unavailable."
 
     # Default to knowledge-first
     try:
-        return generate_answer_knowledge_first(query, username)
+        return generate_answer_knowledge_first(query, username, deadline=deadline)
     except Exception as e:
         print(f"[ERROR] knowledge-first flow crashed: {e}")
         traceback.print_exc()
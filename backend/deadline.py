@@ -0,0 +1,37 @@
+# deadline.py
+"""
+Request deadline passed through every stage of bot.generate_response.
+
+Stages ask how much time is left and skip or downgrade themselves when it is
+short; every such decision is recorded so the caller can report it.
+"""
+import time
+
+
+class Deadline:
+    def __init__(self, budget):
+        self.budget = float(budget)
+        self.expires_at = time.monotonic() + self.budget
+        self.degradations = []
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def has(self, seconds):
+        """True if at least `seconds` of budget are left."""
+        return self.remaining() >= seconds
+
+    def timeout(self, cap):
+        """Timeout for a blocking call: the smaller of `cap` and the time left."""
+        return min(cap, self.remaining())
+
+    def degrade(self, stage, action):
+        note = f"{stage}: {action} ({self.remaining():.1f}s left)"
+        self.degradations.append(note)
+        print(f"[DEADLINE] {note}")
+
+    def __repr__(self):
+        return f"Deadline(budget={self.budget}, remaining={self.remaining():.2f})"
@@ -0,0 +1,196 @@
+# history_store.py
+"""
+Append-only alert/reading history, kept out of users.json.
+
+Layout (under database/history/):
+  readings/<lat>_<lon>.bin  one fixed-width record per alert sweep per location cell
+  alerts/<user>.bin         one fixed-width record per alert sent to a user
+
+Records are appended in time order, so reads mmap the file and binary-search
+the start timestamp. compact() drops expired records and downsamples old
+readings to one record per day.
+"""
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from alert_conditions import mask_conditions
+from live_data import cell_key
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_DIR = os.path.join(BASE_DIR, "../database/history")
+READINGS_DIR = os.path.join(HISTORY_DIR, "readings")
+ALERTS_DIR = os.path.join(HISTORY_DIR, "alerts")
+
+RAW_RETENTION_DAYS = 7   # readings older than this are downsampled to daily
+RETENTION_DAYS = 90      # anything older than this is dropped
+
+# condition masks are alert_conditions.conditions_mask() values
+# ts, temp, wind, uv, pm2_5, pm10, weathercode, condition mask  (28 bytes)
+READING = struct.Struct("<I5fhH")
+# ts, lat*100, lon*100, condition mask  (16 bytes)
+ALERT = struct.Struct("<IiiH2x")
+
+NO_CODE = -1
+_lock = threading.Lock()
+
+
+def _f(value):
+    return math.nan if value is None else float(value)
+
+
+def _unf(value):
+    return None if math.isnan(value) else round(value, 2)
+
+
+def _cell_path(lat, lon):
+    lat, lon = cell_key(lat, lon)
+    return os.path.join(READINGS_DIR, f"{lat:.2f}_{lon:.2f}.bin")
+
+
+def _user_path(username):
+    safe = re.sub(r"[^\w.-]", "_", username)[:40]
+    digest = hashlib.sha1(username.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(ALERTS_DIR, f"{safe}_{digest}.bin")
+
+
+def _append(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _lock, open(path, "ab") as f:
+        f.write(data)
+
+
+# -------------------- WRITE --------------------
+def append_reading(lat, lon, temp=None, wind=None, uv=None, pm25=None, pm10=None,
+                   code=None, mask=0, ts=None):
+    ts = int(ts if ts is not None else time.time())
+    record = READING.pack(ts, _f(temp), _f(wind), _f(uv), _f(pm25), _f(pm10),
+                          NO_CODE if code is None else int(code), mask)
+    _append(_cell_path(lat, lon), record)
+
+
+def append_alert(username, lat, lon, mask, ts=None):
+    ts = int(ts if ts is not None else time.time())
+    lat, lon = cell_key(lat, lon)
+    record = ALERT.pack(ts, round(lat * 100), round(lon * 100), mask)
+    _append(_user_path(username), record)
+
+
+# -------------------- READ --------------------
+def _read_since(path, fmt, since):
+    """Yield unpacked records with ts >= since, via mmap + binary search on ts."""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        count = size // fmt.size  # ignore a torn trailing record
+        if count == 0:
+            return
+        with mmap.mmap(f.fileno(), count * fmt.size, access=mmap.ACCESS_READ) as mm:
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if struct.unpack_from("<I", mm, mid * fmt.size)[0] < since:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            for i in range(lo, count):
+                yield fmt.unpack_from(mm, i * fmt.size)
+
+
+def recent_readings(lat, lon, hours=24):
+    since = int(time.time() - hours * 3600)
+    out = []
+    for ts, temp, wind, uv, pm25, pm10, code, mask in _read_since(_cell_path(lat, lon), READING, since):
+        out.append({
+            "time": ts,
+            "temperature": _unf(temp),
+            "windspeed": _unf(wind),
+            "uv_index": _unf(uv),
+            "pm2_5": _unf(pm25),
+            "pm10": _unf(pm10),
+            "weathercode": None if code == NO_CODE else code,
+            "conditions": mask_conditions(mask),
+        })
+    return out
+
+
+def recent_alerts(username, hours=24 * 7):
+    since = int(time.time() - hours * 3600)
+    return [
+        {"time": ts, "latitude": lat / 100, "longitude": lon / 100, "conditions": mask_conditions(mask)}
+        for ts, lat, lon, mask in _read_since(_user_path(username), ALERT, since)
+    ]
+
+
+# -------------------- COMPACTION --------------------
+def _downsample_daily(records):
+    """Merge readings into one record per UTC day: mean of values, last code, OR of masks."""
+    days = {}
+    for rec in records:
+        days.setdefault(rec[0] // 86400, []).append(rec)
+    merged = []
+    for day in sorted(days):
+        group = days[day]
+        if len(group) == 1:
+            merged.append(group[0])
+            continue
+        values = []
+        for col in range(1, 6):
+            present = [r[col] for r in group if not math.isnan(r[col])]
+            values.append(sum(present) / len(present) if present else math.nan)
+        mask = 0
+        for r in group:
+            mask |= r[7]
+        merged.append((group[-1][0], *values, group[-1][6], mask))
+    return merged
+
+
+def _rewrite(path, fmt, records):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for rec in records:
+            f.write(fmt.pack(*rec))
+    os.replace(tmp, path)
+
+
+def compact(now=None):
+    """Drop expired history and downsample whole days past RAW_RETENTION_DAYS to daily."""
+    now = int(now if now is not None else time.time())
+    drop_before = now - RETENTION_DAYS * 86400
+    # only whole UTC days are merged: a day straddling the boundary stays raw until
+    # it is entirely past it, so no merged record is ever averaged in again
+    raw_since = (now - RAW_RETENTION_DAYS * 86400) // 86400 * 86400
+    stats = {"files": 0, "before": 0, "after": 0}
+
+    for directory, fmt in ((READINGS_DIR, READING), (ALERTS_DIR, ALERT)):
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(directory, name)
+            # hold the lock across read+rewrite so no append lands in between
+            with _lock:
+                records = list(_read_since(path, fmt, drop_before))
+                before = os.path.getsize(path) // fmt.size
+                if fmt is READING:
+                    old = [r for r in records if r[0] < raw_since]
+                    records = _downsample_daily(old) + [r for r in records if r[0] >= raw_since]
+                if not records:
+                    os.remove(path)
+                elif len(records) != before:
+                    _rewrite(path, fmt, records)
+            stats["files"] += 1
+            stats["before"] += before
+            stats["after"] += len(records)
+
+    print(f"[History] Compacted {stats['files']} files: {stats['before']} -> {stats['after']} records.")
+    return stats
@@ -0,0 +1,254 @@
+# inference_pool.py
+"""
+Pool of inference worker processes sharing one copy of the model weights.
+
+The model is loaded once in the parent (bot.py) and the workers are forked
+afterwards, so they inherit the weights copy-on-write instead of each loading
+their own ~1 GB copy. Weights are never written during generation, so the
+pages stay shared and RSS stays close to a single model copy.
+
+Each worker has its own pipe to the parent. Jobs wait in a queue in the parent,
+and a dispatcher thread hands them to idle workers and routes results back to
+the waiting callers. No lock is shared between workers, so a worker killed at
+any point (e.g. by the OOM killer) cannot wedge the others: its pipe hits EOF,
+its job (if any) fails, and it is respawned. Jobs carry an expiry so work
+nobody waits for anymore is dropped before it reaches a worker.
+"""
+import atexit
+import collections
+import itertools
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+HEALTH_CHECK_INTERVAL = 1.0  # seconds between worker liveness checks
+
+
+def _worker_main(generate_fn, threads, conn):
+    # each worker gets its own small intra-op thread budget
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        job_id, prompt, gen_kwargs = job
+        try:
+            conn.send((job_id, generate_fn(prompt, **gen_kwargs), None))
+        except Exception as e:
+            conn.send((job_id, None, f"{type(e).__name__}: {e}"))
+
+
+class InferencePool:
+    """
+    generate_fn(prompt, **gen_kwargs) -> str is run inside the workers.
+    It must be callable in a forked child, i.e. close over an already-loaded
+    CPU model (CUDA contexts do not survive fork).
+    """
+
+    def __init__(self, generate_fn, workers=2, threads_per_worker=1):
+        self.generate_fn = generate_fn
+        self.workers = max(1, int(workers))
+        self.threads_per_worker = max(1, int(threads_per_worker))
+        self._ctx = mp.get_context("fork")
+        self._procs = [None] * self.workers
+        self._conns = [None] * self.workers
+        self._busy = {}  # worker index -> job id it is generating
+        self._queue = collections.deque()  # (job_id, expires_at, prompt, gen_kwargs)
+        self._queue_lock = threading.Lock()
+        self._wake_r = self._wake_w = None
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._dispatcher = None
+        self._closed = False
+        self._started = False
+
+    def _spawn(self, index):
+        parent_conn, child_conn = self._ctx.Pipe()
+        p = self._ctx.Process(
+            target=_worker_main,
+            args=(self.generate_fn, self.threads_per_worker, child_conn),
+            name=f"inference-worker-{index}",
+            daemon=True,
+        )
+        p.start()
+        child_conn.close()  # so the parent sees EOF when the worker dies
+        self._procs[index] = p
+        self._conns[index] = parent_conn
+
+    def start(self):
+        # forked tokenizers complain (and may deadlock) if parallelism was used pre-fork
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        self._wake_r, self._wake_w = self._ctx.Pipe(duplex=False)
+        for i in range(self.workers):
+            self._spawn(i)
+        self._started = True
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name="inference-dispatcher", daemon=True)
+        self._dispatcher.start()
+        atexit.register(self.close)
+        print(f"[INFO] Inference pool started: {self.workers} workers x {self.threads_per_worker} threads.")
+        return self
+
+    def _wake(self):
+        with self._queue_lock:
+            try:
+                self._wake_w.send_bytes(b"")
+            except OSError:
+                pass
+
+    def _resolve(self, job_id, text=None, error=None):
+        with self._pending_lock:
+            future = self._pending.pop(job_id, None)
+        if future is None or future.cancelled():
+            return  # caller already gave up on it
+        try:
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(text)
+        except Exception:
+            pass  # cancelled concurrently
+
+    def _worker_died(self, index):
+        """Fail the job of a dead worker and respawn it."""
+        p = self._procs[index]
+        p.join(timeout=0.1)
+        print(f"[WARN] Inference worker {index} died (exit code {p.exitcode}); respawning.")
+        try:
+            self._conns[index].close()
+        except OSError:
+            pass
+        job_id = self._busy.pop(index, None)
+        if job_id is not None:
+            self._resolve(job_id, error=f"inference worker {index} died")
+        if self._closed:
+            return
+        try:
+            self._spawn(index)
+        except Exception as e:
+            print(f"[WARN] Failed to respawn inference worker {index}: {e}")
+
+    def _next_job(self):
+        """Pop the next job that still has a waiting caller, resolving expired ones."""
+        while True:
+            with self._queue_lock:
+                if not self._queue:
+                    return None
+                job_id, expires_at, prompt, gen_kwargs = self._queue.popleft()
+            with self._pending_lock:
+                waiting = job_id in self._pending
+            if not waiting:
+                continue
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self._resolve(job_id, error="expired before a worker picked it up")
+                continue
+            return job_id, prompt, gen_kwargs
+
+    def _assign(self):
+        for index in range(self.workers):
+            if index in self._busy or not self._procs[index].is_alive():
+                continue
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._conns[index].send(job)
+                self._busy[index] = job[0]
+            except (OSError, EOFError):
+                with self._queue_lock:
+                    self._queue.appendleft((job[0], None, job[1], job[2]))
+                self._worker_died(index)
+
+    def _dispatch(self):
+        last_check = time.monotonic()
+        while not self._closed:
+            self._assign()
+            conns = {c: i for i, c in enumerate(self._conns)}
+            ready = wait(list(conns) + [self._wake_r], timeout=HEALTH_CHECK_INTERVAL)
+            for conn in ready:
+                if conn is self._wake_r:
+                    while self._wake_r.poll():
+                        self._wake_r.recv_bytes()
+                    continue
+                index = conns[conn]
+                try:
+                    job_id, text, error = conn.recv()
+                except (EOFError, OSError):
+                    self._worker_died(index)
+                    continue
+                self._busy.pop(index, None)
+                self._resolve(job_id, text, error)
+
+            if time.monotonic() - last_check >= HEALTH_CHECK_INTERVAL:
+                last_check = time.monotonic()
+                for index, p in enumerate(self._procs):
+                    if not p.is_alive() and not self._closed:
+                        self._worker_died(index)
+
+    def _submit(self, prompt, timeout, gen_kwargs):
+        if self._closed or not self._started:
+            raise RuntimeError("Inference pool is not running")
+        if not self.alive_workers():
+            raise RuntimeError("No live inference workers")
+        job_id = next(self._ids)
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        future = Future()
+        with self._pending_lock:
+            self._pending[job_id] = future
+        with self._queue_lock:
+            self._queue.append((job_id, expires_at, prompt, gen_kwargs))
+        self._wake()
+        return job_id, future
+
+    def submit(self, prompt, timeout=None, **gen_kwargs):
+        """Queue a generation and return a Future resolving to the text.
+        The job is dropped if no worker has picked it up after `timeout` seconds."""
+        return self._submit(prompt, timeout, gen_kwargs)[1]
+
+    def generate(self, prompt, timeout=None, **gen_kwargs):
+        """Blocking submit; raises concurrent.futures.TimeoutError on timeout."""
+        job_id, future = self._submit(prompt, timeout, gen_kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            with self._pending_lock:
+                self._pending.pop(job_id, None)
+            future.cancel()
+            raise
+
+    def alive_workers(self):
+        return sum(1 for p in self._procs if p is not None and p.is_alive())
+
+    def close(self):
+        if self._closed or not self._started:
+            return
+        self._closed = True
+        self._wake()
+        self._dispatcher.join(timeout=5)
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (OSError, EOFError):
+                pass
+        for p in self._procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        for conn in self._conns:
+            conn.close()
+        with self._pending_lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
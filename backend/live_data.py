@@ -0,0 +1,154 @@
+# live_data.py
+"""
+Shared Open-Meteo client used by chat (bot.py) and the alert scheduler (app.py).
+
+- coordinates are rounded to a ~1 km cell, so nearby users share requests
+- identical in-flight requests are coalesced (one upstream call, everyone waits on it)
+- successful responses are cached for a short TTL
+- callers ask only for the hourly/current fields and horizon they use
+
+Returned dicts are shared between callers and must be treated as read-only.
+"""
+import os
+import threading
+import time
+
+import requests
+
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+AIR_QUALITY_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+
+DEFAULT_TIMEOUT = 6  # seconds
+MIN_FETCH_BUDGET = 1.0  # don't go upstream with less than this left on a deadline
+CACHE_TTL = float(os.environ.get("AERIS_LIVE_CACHE_TTL", "300"))  # seconds
+CACHE_MAX_ENTRIES = 2048
+COORD_DECIMALS = 2  # 0.01° ≈ 1.1 km
+
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": "AerisAI/1.0 (contact: none)"})
+
+_lock = threading.Lock()
+_cache = {}     # key -> (expires_at, data)
+_inflight = {}  # key -> _Call
+stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+def cell_key(lat, lon):
+    """Rounded (lat, lon) used both as cache key and as the coordinates sent upstream."""
+    return round(float(lat), COORD_DECIMALS), round(float(lon), COORD_DECIMALS)
+
+
+def _evict_locked(now):
+    for key in [k for k, (expires, _) in _cache.items() if expires <= now]:
+        del _cache[key]
+    while len(_cache) >= CACHE_MAX_ENTRIES:
+        del _cache[next(iter(_cache))]  # oldest insert first
+
+
+def _store(key, data):
+    with _lock:
+        now = time.monotonic()
+        _evict_locked(now)
+        _cache[key] = (now + CACHE_TTL, data)
+
+
+def _get(url, params, timeout):
+    try:
+        resp = SESSION.get(url, params=params, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+    except Exception as e:
+        stats["errors"] += 1
+        print(f"[WARN] Live data request failed: {e}  url={url} params={params}")
+        return None
+
+
+def _fetch(url, params, timeout=DEFAULT_TIMEOUT, deadline=None):
+    key = (url, tuple(sorted(params.items())))
+    with _lock:
+        hit = _cache.get(key)
+        if hit and hit[0] > time.monotonic():
+            stats["hits"] += 1
+            return hit[1]
+
+    # cache hits are free; only an upstream call (or waiting on one) needs budget
+    if deadline is not None:
+        if not deadline.has(MIN_FETCH_BUDGET):
+            deadline.degrade("live data", f"skipped request to {url}")
+            return None
+        timeout = deadline.timeout(timeout)
+
+    with _lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+
+    if not leader:
+        stats["coalesced"] += 1
+        started = time.monotonic()
+        call.event.wait(timeout)
+        if call.result is not None:
+            return call.result
+        # the shared call failed or ran on a shorter (leader's) timeout than ours:
+        # spend whatever is left of our own timeout on a fetch of our own
+        remaining = timeout - (time.monotonic() - started)
+        if remaining < MIN_FETCH_BUDGET:
+            return None
+        stats["misses"] += 1
+        data = _get(url, params, remaining)
+        if data is not None:
+            _store(key, data)
+        return data
+
+    stats["misses"] += 1
+    data = None
+    try:
+        data = _get(url, params, timeout)
+    finally:
+        if data is not None:
+            _store(key, data)
+        with _lock:
+            _inflight.pop(key, None)
+        call.result = data
+        call.event.set()
+    return data
+
+
+def _params(lat, lon, hourly=(), current=(), forecast_hours=None):
+    lat, lon = cell_key(lat, lon)
+    params = {"latitude": lat, "longitude": lon}
+    if hourly:
+        params["hourly"] = ",".join(sorted(hourly))
+    if current:
+        params["current"] = ",".join(sorted(current))
+    if forecast_hours is not None:
+        params["forecast_hours"] = int(forecast_hours)
+    return params
+
+
+def get_forecast(lat, lon, current_weather=False, hourly=(), forecast_hours=None,
+                 timeout=DEFAULT_TIMEOUT, deadline=None):
+    """Open-Meteo forecast JSON (or None) for the cell containing lat/lon."""
+    params = _params(lat, lon, hourly=hourly, forecast_hours=forecast_hours)
+    if current_weather:
+        params["current_weather"] = "true"
+    return _fetch(FORECAST_URL, params, timeout=timeout, deadline=deadline)
+
+
+def get_air_quality(lat, lon, hourly=(), current=(), forecast_hours=None,
+                    timeout=DEFAULT_TIMEOUT, deadline=None):
+    """Open-Meteo air-quality JSON (or None) for the cell containing lat/lon."""
+    params = _params(lat, lon, hourly=hourly, current=current, forecast_hours=forecast_hours)
+    return _fetch(AIR_QUALITY_URL, params, timeout=timeout, deadline=deadline)
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
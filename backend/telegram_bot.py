@@ -12,11 +12,14 @@ bot = Bot(token=BOT_TOKEN)
 def send_message(chat_id, text):
     """
     Sync wrapper that runs the async send_message coroutine.
+    Returns True if the message was sent, False otherwise.
     """
     try:
         # run the coroutine to actually send the message
         asyncio.run(bot.send_message(chat_id=chat_id, text=text))
         print(f"[Telegram] Sent message to {chat_id}")
+        return True
     except Exception as e:
         print(f"[Telegram] Failed to send message to {chat_id}: {e}")
+        return False
 
@@ -0,0 +1,34 @@
+# test_alert_conditions.py
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from alert_conditions import CONDITIONS, conditions_mask, evaluate_conditions, mask_conditions  # noqa: E402
+
+
+def test_every_condition_has_a_category():
+    readings = [
+        (45, None, None, None, None, None), (0, None, None, None, None, None),
+        (None, 80, None, None, None, None), (None, None, 9, None, None, None),
+        (None, None, None, 200, None, None), (None, None, None, None, 250, None),
+        (None, None, None, None, None, 95), (None, None, None, None, None, 63),
+        (None, None, None, None, None, 73),
+    ]
+    seen = 0
+    for reading in readings:
+        conditions = evaluate_conditions(*reading)
+        assert len(conditions) == 1
+        bit, text = conditions[0]
+        assert bit and bit & (bit - 1) == 0  # exactly one category bit
+        assert text.startswith(mask_conditions(bit)[0])
+        seen |= bit
+    assert mask_conditions(seen) == list(CONDITIONS)
+
+
+def test_mask_ignores_live_values():
+    hot = evaluate_conditions(41.2, 70, None, None, None, 95)
+    hotter = evaluate_conditions(41.5, 75, None, None, None, 95)
+    assert [t for _, t in hot] != [t for _, t in hotter]
+    assert conditions_mask(hot) == conditions_mask(hotter)
+    assert conditions_mask(evaluate_conditions(20, 10, 1, 5, 5, 0)) == 0
@@ -0,0 +1,81 @@
+# test_inference_pool.py
+import os
+import signal
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from inference_pool import InferencePool  # noqa: E402
+
+
+def _echo(prompt, **gen_kwargs):
+    if gen_kwargs.get("sleep"):
+        time.sleep(gen_kwargs["sleep"])
+    return f"{prompt}:{os.getpid()}"
+
+
+def _wait_for(condition, timeout=5.0):
+    stop = time.monotonic() + timeout
+    while time.monotonic() < stop:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_killed_idle_worker_does_not_wedge_pool():
+    pool = InferencePool(_echo, workers=3).start()
+    try:
+        assert pool.generate("warmup", timeout=5).startswith("warmup:")
+
+        victim = pool._procs[0]
+        os.kill(victim.pid, signal.SIGKILL)
+        victim.join(timeout=5)
+
+        # remaining workers keep serving, and the pool heals back to full size
+        results = [pool.submit(f"p{i}", timeout=5) for i in range(6)]
+        assert [f.result(timeout=5).split(":")[0] for f in results] == [f"p{i}" for i in range(6)]
+        assert _wait_for(lambda: pool.alive_workers() == 3)
+        assert pool._procs[0].pid != victim.pid
+
+        # the respawned worker takes jobs too
+        pids = {f.result(timeout=5).split(":")[1]
+                for f in [pool.submit("q", timeout=5, sleep=0.2) for _ in range(3)]}
+        assert str(pool._procs[0].pid) in pids
+    finally:
+        pool.close()
+
+
+def test_killed_busy_worker_fails_only_its_job():
+    pool = InferencePool(_echo, workers=2).start()
+    try:
+        slow = pool.submit("slow", timeout=10, sleep=5)
+        assert _wait_for(lambda: pool._busy)
+        index = next(iter(pool._busy))
+        os.kill(pool._procs[index].pid, signal.SIGKILL)
+
+        try:
+            slow.result(timeout=5)
+            raise AssertionError("job of a killed worker should fail")
+        except RuntimeError as e:
+            assert "died" in str(e)
+        assert pool.generate("after", timeout=5).startswith("after:")
+        assert _wait_for(lambda: pool.alive_workers() == 2)
+    finally:
+        pool.close()
+
+
+def test_job_expires_while_queued():
+    pool = InferencePool(_echo, workers=1).start()
+    try:
+        busy = pool.submit("busy", timeout=5, sleep=0.5)
+        queued = pool.submit("queued", timeout=0.1)
+        try:
+            queued.result(timeout=5)
+            raise AssertionError("queued job should have expired")
+        except RuntimeError as e:
+            assert "expired" in str(e)
+        assert busy.result(timeout=5).startswith("busy:")
+    finally:
+        pool.close()
@@ -0,0 +1,46 @@
+# test_user_bulk.py
+import json
+import multiprocessing as mp
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import user_bulk  # noqa: E402
+
+
+def _bump(path, username, times):
+    for _ in range(times):
+        with user_bulk.users_lock(path):
+            users = user_bulk.load_users(path)
+            for user in users:
+                if user["username"] == username:
+                    user["count"] += 1
+            user_bulk.save_users(users, path)
+
+
+def test_users_lock_excludes_other_processes(tmp_path):
+    path = str(tmp_path / "users.json")
+    with open(path, "w") as f:
+        json.dump([{"username": "a", "count": 0}, {"username": "b", "count": 0}], f)
+
+    ctx = mp.get_context("fork")
+    procs = [ctx.Process(target=_bump, args=(path, name, 100)) for name in ("a", "b", "a", "b")]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=60)
+        assert p.exitcode == 0
+
+    counts = {u["username"]: u["count"] for u in user_bulk.load_users(path)}
+    assert counts == {"a": 200, "b": 200}
+
+
+def test_users_lock_is_reentrant(tmp_path):
+    path = str(tmp_path / "users.json")
+    user_bulk.save_users([{"username": "a"}], path)
+    with user_bulk.users_lock(path):
+        with user_bulk.users_lock(path):
+            user_bulk.update_users({"a": {"mode": "High"}}, path)
+    assert user_bulk.load_users(path) == [{"username": "a", "mode": "High"}]
+    assert not user_bulk._flocks
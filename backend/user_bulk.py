@@ -0,0 +1,326 @@
+# user_bulk.py
+"""
+Streaming bulk import / export / batch-patch of users.json.
+
+Input is NDJSON (one JSON object per line) read incrementally. Changes are
+staged in memory and committed every `batch_size` records: each commit takes
+users_lock(), re-reads users.json, applies only the staged changes and saves,
+so single-user writes made by app.py in between are kept. users_lock() also
+holds an flock on users.json.lock, so the CLI and a running app.py exclude
+each other too.
+
+CLI:
+    python user_bulk.py import users.ndjson [--on-conflict skip|update] [--batch-size 500]
+    python user_bulk.py patch patches.ndjson
+    python user_bulk.py export [--include-passwords] > users.ndjson
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+USERS_FILE = os.path.join(BASE_DIR, "../database/users.json")
+
+DEFAULT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+# fields patch / import-update may not change (same rule as /update_user)
+PROTECTED_FIELDS = ("username", "password")
+
+# guards every read-modify-write of users.json (app.py handlers, scheduler, bulk commits);
+# take it through users_lock(), which adds the cross-process file lock
+USERS_LOCK = threading.RLock()
+_flocks = {}  # lock file path -> [open file, depth]; only touched under USERS_LOCK
+
+
+@contextlib.contextmanager
+def users_lock(path=USERS_FILE):
+    """
+    Hold USERS_LOCK plus an exclusive flock on <path>.lock. Re-entrant within a
+    process: the flock is taken on the outermost entry only.
+    """
+    lock_path = os.path.abspath(path) + ".lock"
+    with USERS_LOCK:
+        held = _flocks.get(lock_path)
+        if held is None:
+            f = open(lock_path, "a")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+            except BaseException:
+                f.close()
+                raise
+            held = _flocks[lock_path] = [f, 0]
+        held[1] += 1
+        try:
+            yield
+        finally:
+            held[1] -= 1
+            if held[1] == 0:
+                del _flocks[lock_path]
+                held[0].close()  # releases the flock
+
+
+def default_user(username, email, password):
+    """New user record, as created by /register."""
+    return {
+        "username": username,
+        "email": email,
+        "password": password,
+        "mode": "Low",
+        "age": None,
+        "conditions": "",
+        "joined": datetime.now().strftime("%Y-%m-%d"),
+        "notifications": {},
+        "telegram_chat_id": None,
+        "latitude": None,
+        "longitude": None,
+        # fields for alerts status
+        "last_alert_time": None,
+        "last_alert_reason": None,
+        "active_conditions": [],
+        "active_conditions_mask": 0
+    }
+
+
+def load_users(path=USERS_FILE):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_users(users, path=USERS_FILE):
+    """Write atomically (unique temp file + rename) so readers never see a half-written file."""
+    with users_lock(path):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".users-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(users, f, indent=2)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+
+def update_users(updates, path=USERS_FILE):
+    """
+    Apply {username: {field: value}} to a fresh copy of users.json under
+    users_lock() and save. Returns the usernames that no longer exist.
+    """
+    with users_lock(path):
+        users = load_users(path)
+        index = {u.get("username"): u for u in users}
+        missing = []
+        for username, fields in updates.items():
+            user = index.get(username)
+            if user is None:
+                missing.append(username)
+            else:
+                user.update(fields)
+        if len(missing) < len(updates):
+            save_users(users, path)
+    return missing
+
+
+def _unprotected(record):
+    return {k: v for k, v in record.items() if k not in PROTECTED_FIELDS}
+
+
+def iter_ndjson(lines):
+    """Yield (line_no, record, error) for each non-blank line; lines may be bytes or str."""
+    for line_no, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "record is not a JSON object"
+            continue
+        yield line_no, record, None
+
+
+class _Batch:
+    """
+    Stage changes and commit every batch_size of them. Only the set of known
+    usernames is kept between commits; each commit re-reads users.json under
+    users_lock() and merges the staged changes into it.
+    """
+
+    def __init__(self, path, batch_size, on_conflict="skip"):
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.on_conflict = on_conflict
+        self.usernames = {u.get("username") for u in load_users(path)}
+        self.pending = {}  # username -> ("create", record) | ("update", fields)
+        self.summary = {"created": 0, "updated": 0, "skipped": 0, "failed": 0, "batches": 0, "errors": []}
+
+    def error(self, line_no, msg):
+        self.summary["failed"] += 1
+        if len(self.summary["errors"]) < MAX_REPORTED_ERRORS:
+            self.summary["errors"].append({"line": line_no, "error": msg})
+
+    def create(self, username, record):
+        self.pending[username] = ("create", record)
+        self.usernames.add(username)
+        self.summary["created"] += 1
+        self._maybe_commit()
+
+    def update(self, username, fields):
+        staged = self.pending.get(username)
+        if staged:
+            staged[1].update(fields)
+        else:
+            self.pending[username] = ("update", dict(fields))
+        self.summary["updated"] += 1
+        self._maybe_commit()
+
+    def _maybe_commit(self):
+        if len(self.pending) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        if not self.pending:
+            return
+        with users_lock(self.path):
+            users = load_users(self.path)
+            index = {u.get("username"): u for u in users}
+            for username, (kind, data) in self.pending.items():
+                user = index.get(username)
+                if kind == "create" and user is None:
+                    users.append(data)
+                    index[username] = data
+                elif kind == "create":
+                    # registered by someone else since we checked
+                    self.summary["created"] -= 1
+                    if self.on_conflict == "update":
+                        user.update(_unprotected(data))
+                        self.summary["updated"] += 1
+                    else:
+                        self.summary["skipped"] += 1
+                elif user is not None:
+                    user.update(data)
+                else:
+                    self.summary["updated"] -= 1
+                    self.usernames.discard(username)
+                    self.error(None, f"user deleted during import: {username!r}")
+            save_users(users, self.path)
+        self.pending.clear()
+        self.summary["batches"] += 1
+
+
+def import_users(lines, path=USERS_FILE, batch_size=DEFAULT_BATCH_SIZE, on_conflict="skip"):
+    """
+    Create users from NDJSON records (username, email, password required for new
+    users; any other field is copied). Existing usernames are skipped, or have
+    their non-protected fields merged when on_conflict="update". Returns a summary dict.
+    """
+    if on_conflict not in ("skip", "update"):
+        raise ValueError("on_conflict must be 'skip' or 'update'")
+
+    batch = _Batch(path, batch_size, on_conflict)
+    for line_no, record, err in iter_ndjson(lines):
+        if err:
+            batch.error(line_no, err)
+            continue
+        username = record.get("username")
+        if not username or not isinstance(username, str):
+            batch.error(line_no, "missing username")
+            continue
+
+        if username in batch.usernames:
+            fields = _unprotected(record)
+            if on_conflict == "skip" or not fields:
+                batch.summary["skipped"] += 1
+                continue
+            batch.update(username, fields)
+            continue
+
+        if not record.get("email") or not record.get("password"):
+            batch.error(line_no, "missing email or password")
+            continue
+        user = default_user(username, record["email"], record["password"])
+        user.update(record)
+        batch.create(username, user)
+    batch.commit()
+    return batch.summary
+
+
+def patch_users(lines, path=USERS_FILE, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Apply NDJSON patches {"username": ..., <field>: <value>, ...} to existing users,
+    e.g. setting latitude/longitude/telegram_chat_id in bulk. Returns a summary dict.
+    """
+    batch = _Batch(path, batch_size)
+    for line_no, record, err in iter_ndjson(lines):
+        if err:
+            batch.error(line_no, err)
+            continue
+        username = record.get("username")
+        if not isinstance(username, str) or username not in batch.usernames:
+            batch.error(line_no, f"user not found: {username!r}")
+            continue
+        fields = _unprotected(record)
+        if not fields:
+            batch.summary["skipped"] += 1
+            continue
+        batch.update(username, fields)
+    batch.commit()
+    return batch.summary
+
+
+def export_users(path=USERS_FILE, include_passwords=False):
+    """Yield one NDJSON line per user."""
+    for user in load_users(path):
+        if not include_passwords:
+            user = {k: v for k, v in user.items() if k != "password"}
+        yield json.dumps(user, ensure_ascii=False) + "\n"
+
+
+# -------------------- CLI --------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import/export/patch of Aeris AI users.")
+    parser.add_argument("--users-file", default=USERS_FILE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="create users from NDJSON")
+    p_import.add_argument("file", help="NDJSON file, or - for stdin")
+    p_import.add_argument("--on-conflict", choices=("skip", "update"), default="skip")
+    p_import.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    p_patch = sub.add_parser("patch", help="update existing users from NDJSON")
+    p_patch.add_argument("file", help="NDJSON file, or - for stdin")
+    p_patch.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    p_export = sub.add_parser("export", help="write users as NDJSON to stdout")
+    p_export.add_argument("--include-passwords", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        for line in export_users(args.users_file, include_passwords=args.include_passwords):
+            sys.stdout.write(line)
+        raise SystemExit(0)
+
+    src = sys.stdin if args.file == "-" else open(args.file, "r", encoding="utf-8")
+    with src:
+        if args.command == "import":
+            summary = import_users(src, args.users_file, args.batch_size, args.on_conflict)
+        else:
+            summary = patch_users(src, args.users_file, args.batch_size)
+    print(json.dumps(summary, indent=2))
+    raise SystemExit(1 if summary["failed"] else 0)